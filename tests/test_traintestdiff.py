@@ -3,10 +3,16 @@
 
 """Tests for `traintestdiff` package."""
 
-import pytest
+from __future__ import division
 
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt  # noqa: E402
+import pandas as pd  # noqa: E402
+import pytest  # noqa: E402
 
-from traintestdiff import core
+
+from traintestdiff import core  # noqa: E402
 
 
 @pytest.fixture
@@ -23,3 +29,297 @@ def test_content(response):
     """Sample pytest test function with the pytest fixture as an argument."""
     # from bs4 import BeautifulSoup
     # assert 'GitHub' in BeautifulSoup(response.content).title.string
+
+
+def test_categorical_longform_keeps_bool_and_int_levels_apart():
+    datasets = {
+        'train': pd.DataFrame({'b': [True, False, True], 'n': [0, 1, 2]}),
+    }
+
+    longform = core.categorical_longform(datasets, ['b', 'n'])
+
+    levels = longform.groupby('feature', observed=True)['level'].apply(list)
+    assert levels['b'] == [True, False]
+    assert levels['n'] == [0, 1, 2]
+    assert all(type(level) is not bool for level in levels['n'])
+
+
+def test_plot_categorical_diff_keeps_bool_and_int_levels_apart():
+    datasets = {
+        'train': pd.DataFrame({'b': [True, False, True], 'n': [0, 1, 2]}),
+    }
+
+    _, fig = core.plot_categorical_diff(datasets, ['b', 'n'], kind='count')
+
+    labels = [[t.get_text() for t in ax.get_xticklabels()]
+              for ax in fig.axes[:2]]
+    plt.close(fig)
+    assert labels == [['False', 'True'], ['0', '1', '2']]
+
+
+def _counting_longform(monkeypatch):
+    calls = []
+    longform_func = core.categorical_longform
+
+    def counting(datasets, features):
+        calls.append(tuple(features))
+        return longform_func(datasets, features)
+
+    monkeypatch.setattr(core, 'categorical_longform', counting)
+
+    return calls
+
+
+def test_train_test_diff_caches_longform(monkeypatch):
+    calls = _counting_longform(monkeypatch)
+    diff = core.TrainTestDiff({'train': pd.DataFrame({'s': ['a', 'b', 'a']})})
+
+    first, fig = diff.plot_cat_diff(['s'], kind='count')
+    plt.close(fig)
+    first['prop'] = 0
+    second, fig = diff.plot_cat_diff(['s'])
+    plt.close(fig)
+
+    assert calls == [('s',)]
+    assert second['prop'].tolist() == pytest.approx([2 / 3, 1 / 3])
+
+
+def test_train_test_diff_clear_cache(monkeypatch):
+    calls = _counting_longform(monkeypatch)
+    diff = core.TrainTestDiff({'train': pd.DataFrame({'s': ['a', 'b', 'a']})})
+
+    _, fig = diff.plot_cat_diff(['s'])
+    plt.close(fig)
+    diff.datasets['train'] = pd.DataFrame({'s': ['c']})
+    diff.clear_cache()
+    data, fig = diff.plot_cat_diff(['s'])
+    plt.close(fig)
+
+    assert calls == [('s',), ('s',)]
+    assert data['level'].tolist() == ['c']
+
+
+def test_train_test_diff_box_without_longform():
+    diff = core.TrainTestDiff({'train': pd.DataFrame({'x': [1.0, 2.0]})})
+
+    data, fig = diff.plot_cont_diff(['x'], return_longform=False)
+    plt.close(fig)
+
+    assert data is None
+    assert diff._cont_cache == {}
+
+
+def test_categorical_longform_nullable_int_with_missing_values():
+    column = pd.Series([1, None, 1, 3], dtype='Int64')
+    datasets = {'train': pd.DataFrame({'n': column})}
+
+    longform = core.categorical_longform(datasets, ['n'])
+
+    assert longform['level'].tolist() == [1, 3]
+    assert longform['count'].tolist() == [2, 1]
+    assert longform['prop'].tolist() == [0.5, 0.25]
+
+
+def test_continuous_longform_keeps_int_precision():
+    datasets = {'train': pd.DataFrame({'x': [2 ** 53 + 1, 1]})}
+
+    longform = core.continuous_longform(datasets, ['x'])
+
+    assert longform['value'].dtype == 'int64'
+    assert longform['value'].tolist() == [2 ** 53 + 1, 1]
+
+
+def test_continuous_longform_keeps_datetime_dtype():
+    dates = pd.to_datetime(['2017-01-01', '2017-01-02'])
+    datasets = {
+        'train': pd.DataFrame({'d': dates}),
+        'test': pd.DataFrame({'d': dates[:1]}),
+    }
+
+    longform = core.continuous_longform(datasets, ['d'])
+
+    assert longform['value'].tolist() == [dates[0], dates[1], dates[0]]
+    assert longform['value'].dtype.kind == 'M'
+
+
+def test_longforms_ignore_repeated_features():
+    datasets = {'train': pd.DataFrame({'f': [1, 2], 'g': [3, 3]})}
+
+    categorical = core.categorical_longform(datasets, ['f', 'g', 'f'])
+    continuous = core.continuous_longform(datasets, ['f', 'g', 'f'])
+
+    assert categorical['feature'].tolist() == ['f', 'f', 'g']
+    assert continuous['feature'].tolist() == ['f', 'f', 'g', 'g']
+    assert list(continuous['feature'].cat.categories) == ['f', 'g']
+
+
+@pytest.mark.parametrize('n_jobs', [2, -1])
+def test_longforms_with_threads_match_serial(n_jobs):
+    datasets = {
+        'train': pd.DataFrame({'s': ['a', 'b', 'a'], 'x': [1.0, 2.0, 3.0]}),
+        'test': pd.DataFrame({'s': ['b', 'c'], 'x': [4.0, 5.0]}),
+    }
+
+    for longform_func, features in [(core.categorical_longform, ['s']),
+                                    (core.continuous_longform, ['x'])]:
+        serial = longform_func(datasets, features)
+        threaded = longform_func(datasets, features, n_jobs=n_jobs)
+        pd.testing.assert_frame_equal(serial, threaded)
+
+
+def test_longforms_with_threads_and_no_datasets():
+    longform = core.continuous_longform({}, ['x'], n_jobs=-1)
+
+    assert longform.shape == (0, 3)
+
+
+@pytest.mark.parametrize('n_jobs', [0, -2, -5])
+def test_longforms_reject_invalid_jobs(n_jobs):
+    datasets = {'train': pd.DataFrame({'x': [1.0]})}
+
+    for longform_func in [core.categorical_longform,
+                          core.continuous_longform]:
+        with pytest.raises(ValueError):
+            longform_func(datasets, ['x'], n_jobs=n_jobs)
+
+
+def test_plot_continuous_diff_box_without_longform():
+    datasets = {
+        'train': pd.DataFrame({'x': [1.0, 2.0, 3.0, None], 'y': [1, 2, 3, 4]}),
+        'test': pd.DataFrame({'x': [2.0, 4.0], 'y': [5, 6]}),
+    }
+
+    data, fig = core.plot_continuous_diff(datasets, ['x', 'y'],
+                                          return_longform=False)
+    titles = [ax.get_title() for ax in fig.axes]
+    ticks = [t.get_text() for t in fig.axes[0].get_xticklabels()]
+    plt.close(fig)
+
+    assert data is None
+    assert titles == ['feature = x', 'feature = y']
+    assert ticks == ['train', 'test']
+
+
+def test_plot_continuous_diff_without_longform_needs_box():
+    datasets = {'train': pd.DataFrame({'x': [1.0]})}
+
+    with pytest.raises(ValueError):
+        core.plot_continuous_diff(datasets, ['x'], kind='violin',
+                                  return_longform=False)
+
+
+@pytest.fixture
+def datasets():
+    train = pd.DataFrame({
+        's': ['a', 'b', 'a', None],
+        'n': [2, 0, 2, 2],
+        'b': [True, False, True, True],
+        'c': pd.Categorical(['x', 'x', 'y', 'x'], categories=['x', 'y', 'z']),
+        'x': [1.5, None, 3.0, 4.0],
+    })
+    test = pd.DataFrame({
+        's': ['b', 'b'],
+        'n': [1, 0],
+        'b': [False, False],
+        'c': pd.Categorical(['y', 'y'], categories=['x', 'y', 'z']),
+        'x': [5.0, 6.0],
+    })
+
+    return {'train': train, 'test': test}
+
+
+def _as_objects(longform):
+    return longform.astype({'dataset': object, 'feature': object})
+
+
+def test_categorical_longform(datasets):
+    longform = core.categorical_longform(datasets, ['s', 'n', 'b', 'c'])
+
+    expected = pd.DataFrame(
+        [['a', 2, 's', 'train', 0.5],
+         ['b', 1, 's', 'train', 0.25],
+         [0, 1, 'n', 'train', 0.25],
+         [2, 3, 'n', 'train', 0.75],
+         [True, 3, 'b', 'train', 0.75],
+         [False, 1, 'b', 'train', 0.25],
+         ['x', 3, 'c', 'train', 0.75],
+         ['y', 1, 'c', 'train', 0.25],
+         ['b', 2, 's', 'test', 1.0],
+         [0, 1, 'n', 'test', 0.5],
+         [1, 1, 'n', 'test', 0.5],
+         [False, 2, 'b', 'test', 1.0],
+         ['y', 2, 'c', 'test', 1.0]],
+        columns=['level', 'count', 'feature', 'dataset', 'prop'])
+    expected = expected.astype({'level': object, 'feature': object,
+                                'dataset': object})
+    pd.testing.assert_frame_equal(_as_objects(longform), expected)
+    assert list(longform['feature'].cat.categories) == ['s', 'n', 'b', 'c']
+    assert list(longform['dataset'].cat.categories) == ['train', 'test']
+
+
+def test_continuous_longform(datasets):
+    longform = core.continuous_longform(datasets, ['x', 'n'])
+
+    expected = pd.DataFrame({
+        'dataset': ['train'] * 8 + ['test'] * 4,
+        'feature': ['x'] * 4 + ['n'] * 4 + ['x'] * 2 + ['n'] * 2,
+        'value': [1.5, None, 3.0, 4.0, 2, 0, 2, 2, 5.0, 6.0, 1, 0],
+    }).astype({'dataset': object, 'feature': object})
+    pd.testing.assert_frame_equal(_as_objects(longform), expected)
+    assert list(longform['feature'].cat.categories) == ['x', 'n']
+
+
+def test_longforms_missing_feature(datasets):
+    datasets['test'] = datasets['test'].drop(columns='x')
+
+    for longform_func in [core.categorical_longform,
+                          core.continuous_longform]:
+        with pytest.raises(KeyError, match='`x` feature missing in `test`'):
+            longform_func(datasets, ['s', 'x'])
+
+
+def test_datasets_from_frame():
+    frame = pd.DataFrame({'s': ['b', 'a', None, 'b'], 'x': [1, 2, 3, 4]})
+
+    datasets = core.datasets_from_frame(frame, 's')
+
+    assert list(datasets) == ['b', 'a']
+    pd.testing.assert_frame_equal(datasets['b'], frame.iloc[[0, 3]])
+    pd.testing.assert_frame_equal(datasets['a'], frame.iloc[[1]])
+
+
+def test_datasets_from_frame_categorical_feature():
+    frame = pd.DataFrame({
+        's': pd.Categorical(['b', 'a', 'b'], categories=['a', 'b', 'c']),
+    })
+
+    datasets = core.datasets_from_frame(frame, 's')
+
+    assert sorted(datasets) == ['a', 'b']
+
+
+def test_categorical_longform_categorical_column_uses_category_order():
+    column = pd.Categorical(['x', None, 'y', 'x'], categories=['z', 'y', 'x'])
+    datasets = {'train': pd.DataFrame({'c': column})}
+
+    longform = core.categorical_longform(datasets, ['c'])
+
+    assert longform['level'].tolist() == ['y', 'x']
+    assert longform['count'].tolist() == [1, 2]
+    assert longform['prop'].tolist() == [0.25, 0.5]
+
+
+def test_plot_categorical_diff_keeps_datasets_without_counts():
+    datasets = {
+        'train': pd.DataFrame({'s': ['a', 'b']}),
+        'test': pd.DataFrame({'s': [None, None]}),
+    }
+
+    _, fig = core.plot_categorical_diff(datasets, ['s'], kind='count')
+    ax = fig.axes[0]
+    legend = [t.get_text() for t in ax.get_legend().get_texts()]
+    heights = [patch.get_height() for patch in ax.patches]
+    plt.close(fig)
+
+    assert legend == ['train', 'test']
+    assert heights == [1, 1, 0, 0]
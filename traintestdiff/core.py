@@ -1,9 +1,13 @@
 from __future__ import division
-from itertools import product
+try:
+    from os import cpu_count
+except ImportError:  # Python < 3.4
+    from multiprocessing import cpu_count
 
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
+from matplotlib.cbook import boxplot_stats
 import seaborn as sns
 
 __alll__ = [
@@ -13,11 +17,23 @@ __alll__ = [
 
 
 def _check_features_presence(datasets, features):
+    for name, dataset in datasets.items():
+        columns = set(dataset.columns)
+        missing = [feature for feature in features if feature not in columns]
+        if missing:
+            message = "`{}` feature missing in `{}`".format(missing[0], name)
+            raise KeyError(message)
+
+
+def _unique_features(features):
+    # Repeated features are kept once, in order of first appearance
+    unique, seen = [], set()
     for feature in features:
-        for name, dataset in datasets.items():
-            if feature not in dataset.columns:
-                message = "`{}` feature missing in `{}`".format(feature, name)
-                raise KeyError(message)
+        if feature not in seen:
+            seen.add(feature)
+            unique.append(feature)
+
+    return unique
 
 
 def datasets_from_frame(dataframe, feature):
@@ -40,8 +56,8 @@ def datasets_from_frame(dataframe, feature):
     Raises:
         KeyError: if ``feature`` is not present in ``dataframe``
     """
-    grouped = dataframe.groupby([feature])
-    datasets = dict(e for e in grouped)
+    groups = dataframe.groupby(feature, sort=False, observed=True).indices
+    datasets = {k: dataframe.take(v) for k, v in groups.items()}
 
     return datasets
 
@@ -49,67 +65,167 @@ def datasets_from_frame(dataframe, feature):
 # Long Form Data
 
 
-def _cat_longform(dataset, name, feature):
-    data = dataset[feature].value_counts().reset_index()
-    data.columns = ['level', 'count']
-    data['feature'] = feature
-    data['dataset'] = name
+# Largest level of an integer feature counted without factorizing
+BINCOUNT_MAX_LEVEL = 2 ** 16
+
+
+def _level_counts(values):
+    # Small non negative integers are already codes, bincount them directly,
+    # nullable extension arrays may hold missing values so they're factorized
+    if (isinstance(values, np.ndarray) and values.dtype.kind in 'iu'
+            and values.size and values.min() >= 0
+            and values.max() < BINCOUNT_MAX_LEVEL):
+        counts = np.bincount(values)
+        levels = np.flatnonzero(counts)
+        return levels.astype(object), counts[levels]
+
+    # Categoricals already hold codes, only observed categories are kept
+    if isinstance(values, pd.Categorical):
+        codes = values.codes
+        counts = np.bincount(codes[codes >= 0],
+                             minlength=len(values.categories))
+        observed = np.flatnonzero(counts)
+        levels = np.asarray(values.categories[observed], dtype=object)
+        return levels, counts[observed]
+
+    # One pass bincount over the factorized codes, missing values are -1
+    codes, levels = pd.factorize(values, sort=False)
+    counts = np.bincount(codes[codes >= 0], minlength=len(levels))
+
+    return np.asarray(levels, dtype=object), counts
+
+
+def _cat_longform(dataset, features):
+    levels, counts = zip(*[_level_counts(dataset[f].values) for f in features])
+    codes = np.arange(len(features)).repeat([len(c) for c in counts])
+
+    data = pd.DataFrame()
+    data['level'] = np.concatenate(levels)
+    data['count'] = np.concatenate(counts)
+    data['feature'] = pd.Categorical.from_codes(codes, categories=features)
     data['prop'] = data['count'] / dataset.shape[0]
 
     return data
 
 
-def _cont_longform(dataset, name, feature):
-    data = pd.DataFrame()
-    data['dataset'] = np.repeat(name, dataset.shape[0])
-    data['feature'] = np.repeat(feature, dataset.shape[0])
-    data['value'] = dataset[feature]
+def _map(func, items, n_jobs):
+    if n_jobs == 0 or n_jobs < -1:
+        raise ValueError("n_jobs must be a positive number of threads or -1")
+
+    if n_jobs == 1 or len(items) < 2:
+        return [func(item) for item in items]
+
+    # Imported here so Python 2 only needs the `futures` backport for threads
+    from concurrent.futures import ThreadPoolExecutor
+
+    # Datasets are independent and numpy/pandas release the GIL
+    n_jobs = (cpu_count() or 1) if n_jobs < 0 else n_jobs
+    with ThreadPoolExecutor(max_workers=min(len(items), n_jobs)) as ex:
+        return list(ex.map(func, items))
+
+
+def _longform_frame(datasets, features, func, n_jobs=1):
+    _check_features_presence(datasets, features)
+
+    names = list(datasets.keys())
+    data = _map(lambda name: func(datasets[name], features), names, n_jobs)
+    codes = np.arange(len(names)).repeat([part.shape[0] for part in data])
+
+    # Parts share the feature categories so `pd.concat` keeps them as codes,
+    # dataset labels are added afterwards for the same reason
+    data = pd.concat(data, ignore_index=True)
+    data.insert(data.columns.get_loc('prop'), 'dataset',
+                pd.Categorical.from_codes(codes, categories=names))
 
     return data
 
 
-def _longform_frame(datasets, features, func):
+def _cont_longform_frame(datasets, features, n_jobs=1):
     _check_features_presence(datasets, features)
 
-    data_grid = product(datasets.items(), features)
-    data = [func(d, n, f) for (n, d), f in data_grid]
-    data = pd.concat(data)
+    names = list(datasets.keys())
+    sizes = [datasets[name].shape[0] * len(features) for name in names]
+    offsets = np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64)
+    columns = [datasets[name][f] for name in names for f in features]
+
+    # Preallocate plain numpy numbers in their common dtype, `np.bool_` is the
+    # identity of `np.result_type`. Datetimes and extension dtypes are left
+    # to `pd.concat` so they keep their dtype
+    dtypes = [column.dtype for column in columns]
+    if all(isinstance(d, np.dtype) and d.kind in 'biuf' for d in dtypes):
+        values = np.empty(offsets[-1], dtype=np.result_type(np.bool_, *dtypes))
+    else:
+        values = None
+    feature_codes = np.empty(offsets[-1], dtype=np.int16)
+
+    def fill(i):
+        dataset = datasets[names[i]]
+        start = offsets[i]
+        for code, feature in enumerate(features):
+            end = start + dataset.shape[0]
+            if values is not None:
+                values[start:end] = dataset[feature].values
+            feature_codes[start:end] = code
+            start = end
+
+    _map(fill, range(len(names)), n_jobs)
+
+    if values is None:
+        values = pd.concat(columns, ignore_index=True)
+
+    dataset_codes = np.arange(len(names)).repeat(sizes)
+    data = pd.DataFrame()
+    data['dataset'] = pd.Categorical.from_codes(
+        dataset_codes, categories=names)
+    data['feature'] = pd.Categorical.from_codes(
+        feature_codes, categories=features)
+    data['value'] = values
 
     return data
 
 
-def categorical_longform(datasets, features):
+def categorical_longform(datasets, features, n_jobs=1):
     """Given datasets and features it returns a long form representation of it
 
     Args:
         datasets (dict): each key is a dataset name and each value is a ``pandas.DataFrame``
         features (list): a list of string features present in the datasets
+        n_jobs (int): a positive number of threads used to process the
+            datasets or ``-1`` to use all the cores, threads need the
+            ``futures`` backport on Python 2
 
     Returns:
         pandas.core.frame.DataFrame: A tidy data long form
 
     Raises:
         KeyError: if any of the ``features`` isn't present in the ``datasets`` dict
+        ValueError: if ``n_jobs`` is neither positive nor ``-1``
     """
-    longform = _longform_frame(datasets, features, _cat_longform)
+    features = _unique_features(features)
+    longform = _longform_frame(datasets, features, _cat_longform, n_jobs)
 
     return longform
 
 
-def continuous_longform(datasets, features):
+def continuous_longform(datasets, features, n_jobs=1):
     """Given datasets and features it returns a long form representation of it
 
     Args:
         datasets (dict): each key is a dataset name and each value is a ``pandas.DataFrame``
         features (list): a list of string features present in the datasets
+        n_jobs (int): a positive number of threads used to process the
+            datasets or ``-1`` to use all the cores, threads need the
+            ``futures`` backport on Python 2
 
     Returns:
         pandas.core.frame.DataFrame: A tidy data longform dataframe
 
     Raises:
         KeyError: if any of the ``features`` isn't present in the ``datasets`` dict
+        ValueError: if ``n_jobs`` is neither positive nor ``-1``
     """
-    longform = _longform_frame(datasets, features, _cont_longform)
+    features = _unique_features(features)
+    longform = _cont_longform_frame(datasets, features, n_jobs)
 
     return longform
 
@@ -118,6 +234,15 @@ def continuous_longform(datasets, features):
 
 TITLE_FONTSIZE = 20
 TITLE_YSPACE = 1.06
+TITLE_MAX_DATASETS = 5
+
+
+def _default_title(names):
+    names = [str(name) for name in names]
+    if len(names) > TITLE_MAX_DATASETS:
+        names = names[:3] + ["...({} datasets)".format(len(names))]
+
+    return "{} differences".format("/".join(names))
 
 
 def plot_continuous_diff(datasets,
@@ -126,7 +251,8 @@ def plot_continuous_diff(datasets,
                          col_wrap=3,
                          size=4,
                          aspect=1,
-                         title=None):
+                         title=None,
+                         return_longform=True):
     """Plots the distribution differences of continuous features in each dataset
 
     Args:
@@ -141,6 +267,9 @@ def plot_continuous_diff(datasets,
         aspect (float): Aspect ratio of each facet, so that aspect * size gives the width
             of each facet in inches
         title (str): the title of the figure
+        return_longform (bool): if ``False`` the boxes are drawn straight
+            from the datasets, skipping the longform data frame, which is
+            returned as ``None``. Only supported for ``kind="box"``
 
     Returns:
         (pandas.core.frameDataFrame, matplotlib.Figure): a tuple with a longform data frame
@@ -148,11 +277,30 @@ def plot_continuous_diff(datasets,
 
     Raises:
         KeyError: if any of the ``features`` isn't present in the ``datasets`` dict
+        ValueError: if ``return_longform`` is ``False`` and ``kind`` isn't
+            ``"box"``
     """
     if title is None:
-        title = "{} differences".format("/".join(datasets.keys()))
+        title = _default_title(datasets)
+
+    features = _unique_features(features)
+    if not return_longform:
+        if kind != "box":
+            message = "`return_longform=False` only supports kind `box`"
+            raise ValueError(message)
+
+        _check_features_presence(datasets, features)
+        fig = _draw_continuous_box(datasets, features, col_wrap, size, aspect,
+                                   title)
+        return None, fig
 
     data = continuous_longform(datasets, features)
+    fig = _draw_continuous_diff(data, kind, col_wrap, size, aspect, title)
+
+    return data, fig
+
+
+def _draw_continuous_diff(data, kind, col_wrap, size, aspect, title):
     grid = sns.factorplot(
         x="dataset",
         y="value",
@@ -166,7 +314,43 @@ def plot_continuous_diff(datasets,
 
     grid.fig.suptitle(title, y=TITLE_YSPACE, fontsize=TITLE_FONTSIZE)
 
-    return data, grid.fig
+    return grid.fig
+
+
+def _draw_continuous_box(datasets, features, col_wrap, size, aspect, title):
+    # Box statistics only need quantiles of each column, so they are computed
+    # on the raw arrays instead of a stacked longform
+    palette = sns.color_palette(n_colors=len(datasets))
+
+    n_axes = len(features)
+    ncol = min(col_wrap, n_axes)
+    nrow = int(np.ceil(n_axes / col_wrap))
+
+    figsize = (ncol * size * aspect, nrow * size)
+    fig, axes = plt.subplots(nrow, ncol, figsize=figsize, squeeze=False)
+    fig.suptitle(title, y=TITLE_YSPACE, fontsize=TITLE_FONTSIZE)
+
+    axes = axes.ravel()
+    for ax in axes[n_axes:]:
+        ax.set_visible(False)
+
+    for feature, ax in zip(features, axes):
+        stats = []
+        for name, dataset in datasets.items():
+            values = dataset[feature].values
+            values = values[~pd.isnull(values)]
+            stats.extend(boxplot_stats(values, labels=[name]))
+
+        boxes = ax.bxp(stats, patch_artist=True, medianprops={'color': 'k'})
+        for box, color in zip(boxes['boxes'], palette):
+            box.set_facecolor(color)
+        ax.set_title("feature = {}".format(feature))
+        ax.set_xlabel("dataset")
+        ax.set_ylabel("value")
+
+    fig.tight_layout()
+
+    return fig
 
 
 def plot_categorical_diff(datasets,
@@ -202,42 +386,90 @@ def plot_categorical_diff(datasets,
         KeyError: if any of the ``features`` isn't present in the ``datasets`` dict
     """
     if title is None:
-        title = "{} differences".format("/".join(datasets.keys()))
+        title = _default_title(datasets)
 
+    features = _unique_features(features)
     longform_data = categorical_longform(datasets, features)
+    fig = _draw_categorical_diff(longform_data, features, kind, col_wrap, size,
+                                 aspect, title)
+
+    return longform_data, fig
+
+
+def _cat_matrix(data, kind, dataset_names):
+    # Longform slice of a single feature to a level x dataset matrix, levels
+    # are pivoted per feature since values like `True` and `1` compare equal
+    matrix = data.pivot(index='level', columns='dataset', values=kind)
+    matrix = matrix.reindex(columns=dataset_names).fillna(0)
+
+    return matrix
+
+
+def _draw_categorical_diff(longform_data, features, kind, col_wrap, size,
+                           aspect, title):
+    dataset_names = longform_data['dataset'].cat.categories
+    palette = sns.color_palette(n_colors=len(dataset_names))
 
     # Group longform and sort by `features` order
-    grouped_features = longform_data.groupby(['feature'])
+    grouped_features = longform_data.groupby('feature', sort=False,
+                                             observed=True)
 
-    grouped_features = sorted(
-        grouped_features, key=lambda x: features.index(x[0]))
+    order = {feature: i for i, feature in enumerate(features)}
+    grouped_features = sorted(grouped_features, key=lambda x: order[x[0]])
 
-    ncol = col_wrap
     n_axes = len(features)
+    ncol = min(col_wrap, n_axes)
     nrow = int(np.ceil(n_axes / col_wrap))
 
     figsize = (ncol * size * aspect, nrow * size)
-    fig = plt.figure(figsize=figsize)
+    fig, axes = plt.subplots(nrow, ncol, figsize=figsize, squeeze=False)
     fig.suptitle(title, y=TITLE_YSPACE, fontsize=TITLE_FONTSIZE)
     plt.subplots_adjust(wspace=0.5, hspace=0.35)
 
-    axes = np.empty(n_axes, object)
-    for i in range(n_axes):
-        axes[i] = fig.add_subplot(nrow, ncol, i + 1)
+    axes = axes.ravel()
+    for ax in axes[n_axes:]:
+        ax.set_visible(False)
 
-    data_grid = zip(grouped_features, axes)
-    for (name, data), ax in data_grid:
-        sns.barplot(
-            x="level", y=kind, hue="dataset", data=data, ax=ax).set_title(name)
+    for i, ax in enumerate(axes[:len(grouped_features)]):
+        # Drop each feature slice from the list once it's drawn
+        name, data = grouped_features[i]
+        grouped_features[i] = None
 
-    return longform_data, fig
+        # Counts are already aggregated, draw them without seaborn's
+        # regrouping and bootstrapping of every bar
+        data = _cat_matrix(data, kind, dataset_names)
+        data.plot.bar(ax=ax, rot=0, width=0.8, color=palette)
+        ax.set_ylabel(kind)
+        ax.set_title(name)
+
+    return fig
 
 
 class TrainTestDiff(object):
-    """ Helper class to ease distribution analysis on the same datasets"""
+    """ Helper class to ease distribution analysis on the same datasets
+
+    Longform frames are cached by features, call :meth:`clear_cache` after
+    modifying ``datasets``
+    """
 
     def __init__(self, datasets):
         self.datasets = datasets
+        self._cat_cache = {}
+        self._cont_cache = {}
+        self._default_title = _default_title(datasets)
+
+    def clear_cache(self):
+        """ Forgets the longform frames computed by previous plots"""
+        self._cat_cache.clear()
+        self._cont_cache.clear()
+        self._default_title = _default_title(self.datasets)
+
+    def _longform(self, cache, longform_func, features):
+        key = tuple(features)
+        if key not in cache:
+            cache[key] = longform_func(self.datasets, features)
+
+        return cache[key]
 
     def plot_cont_diff(self,
                        features,
@@ -245,12 +477,31 @@ class TrainTestDiff(object):
                        col_wrap=3,
                        size=4,
                        aspect=1,
-                       title=None):
+                       title=None,
+                       return_longform=True):
         """ See :func:`plot_continuous_diff`"""
-        return plot_continuous_diff(self.datasets, features, kind, col_wrap,
-                                    size, aspect, title)
+        if title is None:
+            title = self._default_title
+
+        if not return_longform:
+            return plot_continuous_diff(self.datasets, features, kind,
+                                        col_wrap, size, aspect, title,
+                                        return_longform)
+
+        features = _unique_features(features)
+        data = self._longform(self._cont_cache, continuous_longform, features)
+        fig = _draw_continuous_diff(data, kind, col_wrap, size, aspect, title)
+
+        return data.copy(), fig
 
     def plot_cat_diff(self, features, col_wrap=3, kind="prop", title=None):
         """ See :func:`plot_categorical_diff`"""
-        return plot_categorical_diff(
-            self.datasets, features, kind=kind, col_wrap=col_wrap, title=title)
+        if title is None:
+            title = self._default_title
+
+        features = _unique_features(features)
+        data = self._longform(self._cat_cache, categorical_longform, features)
+        fig = _draw_categorical_diff(data, features, kind, col_wrap, size=4,
+                                     aspect=1, title=title)
+
+        return data.copy(), fig